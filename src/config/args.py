@@ -59,10 +59,22 @@ def parse_base_args(parser=None):
                       help='Directory to save results')
     parser.add_argument('--include_sundays', action='store_true',
                       help='Include Sundays in the time blocks (default: False)')
+    parser.add_argument('--cache_splits', action='store_true',
+                      help='Cache the extracted train/val/test tensors next to the torch input and memory-map them on later runs')
+    parser.add_argument('--cache_gso', action='store_true',
+                      help='Cache built graph shift operators under data_dir/processed/gso_cache')
     
     # Common training parameters
     parser.add_argument('--enable_cuda', action='store_true', 
                       help='Enable CUDA')
+    parser.add_argument('--compile', action='store_true',
+                      help='Wrap the model with torch.compile')
+    parser.add_argument('--amp', action='store_true',
+                      help='Use bfloat16 autocast on CUDA for training, validation, threshold search and test passes')
+    parser.add_argument('--tf32', action='store_true',
+                      help='Allow TF32 tensor cores for FP32 matmuls/convolutions on CUDA')
+    parser.add_argument('--channels_last', action='store_true',
+                      help='Use channels_last memory format for the model and input batches')
     parser.add_argument('--seed', type=int, default=42, 
                       help='Random seed')
     
@@ -70,6 +82,8 @@ def parse_base_args(parser=None):
                       help='Batch size')
     parser.add_argument('--epochs', type=int, default=100, 
                       help='Number of epochs')
+    parser.add_argument('--num_workers', type=int, default=2,
+                      help='Number of DataLoader worker processes')
         
     return parser
 
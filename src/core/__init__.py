@@ -1,3 +1,4 @@
+from .uri_dict import *
 from .measurement import *
 from .device import *
 from .room import *
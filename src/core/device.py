@@ -1,11 +1,18 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from typing import List, Optional, Dict, Any, Set
+import numpy as np
 import pandas as pd
 from rdflib import URIRef, Namespace, Literal, RDF
 import datetime
 
 from ..config.namespaces import NamespaceMixin
 from .measurement import Measurement
+from .uri_dict import intern_uri
+
+# Derived slots left out of pickles and rebuilt in Device.__setstate__
+# (str hashes are salted per process, so a stored hash is stale after loading;
+# the timestamp index is cheap to rebuild and would bloat every pickle)
+_UNPICKLED_SLOTS = frozenset({"_hash", "_properties_str", "_ts_array", "_ts_sorted_idx"})
 
 
 @dataclass(slots=True)
@@ -18,11 +25,26 @@ class Device(NamespaceMixin):
     measurements: List[Measurement] = field(default_factory=list)
     properties: Set[URIRef] = field(default_factory=set)
     measurements_by_property: Dict[URIRef, List[Measurement]] = field(default_factory=dict)
+    # Lazily built timestamp index for get_measurements_in_timeframe (None = stale)
+    _ts_array: Optional[np.ndarray] = field(default=None, init=False, repr=False, compare=False)
+    _ts_sorted_idx: Optional[np.ndarray] = field(default=None, init=False, repr=False, compare=False)
+    # hash(self.uri), computed once; the URI is not expected to change
+    _hash: int = field(default=0, init=False, repr=False, compare=False)
+    # str() of each property, kept in sync by add_measurement for to_dict
+    _properties_str: List[str] = field(default_factory=list, init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        """Cache the URI hash and property strings."""
+        self._hash = hash(self.uri)
+        self._properties_str = [str(property) for property in self.properties]
         
     def add_measurement(self, measurement: Measurement) -> None:
         """Add a measurement and update related collections."""
         self.measurements.append(measurement)
+        self._ts_array = None
         if measurement.property_type:
+            if measurement.property_type not in self.properties:
+                self._properties_str.append(str(measurement.property_type))
             self.properties.add(measurement.property_type)
             self.measurements_by_property.setdefault(measurement.property_type, []).append(measurement)
     
@@ -35,29 +57,83 @@ class Device(NamespaceMixin):
                                       start_time: datetime.datetime,
                                       end_time: datetime.datetime) -> List[Measurement]:
         """Get all measurements within a specific timeframe."""
-        return [measurement for measurement in self.measurements
-                if start_time <= measurement.timestamp <= end_time]
+        if self._ts_array is None or len(self._ts_array) != len(self.measurements):
+            self._build_timestamp_index()
+        lo = np.searchsorted(self._ts_array, start_time, side='left')
+        hi = np.searchsorted(self._ts_array, end_time, side='right')
+        return [self.measurements[i] for i in self._ts_sorted_idx[lo:hi]]
+    
+    def _build_timestamp_index(self) -> None:
+        """Build the sorted timestamp array used for range lookups."""
+        timestamps = np.array([measurement.timestamp for measurement in self.measurements], dtype=object)
+        self._ts_sorted_idx = np.argsort(timestamps, kind="stable")
+        self._ts_array = timestamps[self._ts_sorted_idx]
     
-    def to_dataframe(self) -> pd.DataFrame:
-        """Convert measurements to a Pandas DataFrame."""
-        data = []
-        for measurement in self.measurements:
-            row = {
-                "measurement_uri": str(measurement.meas_uri),
-                "timestamp": measurement.timestamp,
-                "value": measurement.value,
-                "device_uri": str(self.uri),
-                "device_type": self.device_type,
-                "room": str(self.room) if self.room else None,
-            }
-            if measurement.property_type:
-                row["property_type"] = str(measurement.property_type)
-            if measurement.unit:
-                row["unit"] = str(measurement.unit)
-            data.append(row)
-        df = pd.DataFrame(data)
+    def to_dataframe(self, encode_uris: bool = False) -> pd.DataFrame:
+        """
+        Convert measurements to a Pandas DataFrame.
+        
+        Args:
+            encode_uris: If True, the device/room/property/unit columns are stored as
+                         int32 ids ("device_id", "room_id", "property_id", "unit_id")
+                         from `uri_dict`; use `decode_column` to get the strings back.
+        """
+        n = len(self.measurements)
+        meas_uris = [None] * n
+        timestamps = [None] * n
+        values = np.empty(n, dtype=np.float64)
+
+        if encode_uris:
+            property_types = np.empty(n, dtype=np.int32)
+            units = np.empty(n, dtype=np.int32)
+            for i, measurement in enumerate(self.measurements):
+                meas_uris[i] = str(measurement.meas_uri)
+                timestamps[i] = measurement.timestamp
+                values[i] = measurement.value
+                property_types[i] = intern_uri(measurement.property_type or None)
+                units[i] = intern_uri(measurement.unit or None)
+
+            df = pd.DataFrame({
+                "measurement_uri": meas_uris,
+                "timestamp": timestamps,
+                "value": values,
+                "device_id": np.full(n, intern_uri(self.uri), dtype=np.int32),
+                "device_type": [self.device_type] * n,
+                "room_id": np.full(n, intern_uri(self.room or None), dtype=np.int32),
+                "property_id": property_types,
+                "unit_id": units,
+            })
+        else:
+            property_types = [None] * n
+            units = [None] * n
+
+            # Device-level columns are identical for every row
+            device_uri = str(self.uri)
+            room = str(self.room) if self.room else None
+
+            for i, measurement in enumerate(self.measurements):
+                meas_uris[i] = str(measurement.meas_uri)
+                timestamps[i] = measurement.timestamp
+                values[i] = measurement.value
+                if measurement.property_type:
+                    property_types[i] = str(measurement.property_type)
+                if measurement.unit:
+                    units[i] = str(measurement.unit)
+
+            df = pd.DataFrame({
+                "measurement_uri": meas_uris,
+                "timestamp": timestamps,
+                "value": values,
+                "device_uri": [device_uri] * n,
+                "device_type": [self.device_type] * n,
+                "room": [room] * n,
+                "property_type": property_types,
+                "unit": units,
+            })
+
         if not df.empty:
-            df.sort_values("timestamp", inplace=True)
+            order = np.argsort(np.array(timestamps, dtype=object), kind="stable")
+            df = df.iloc[order]
         return df
     
     def to_dict(self) -> Dict[str, Any]:
@@ -69,7 +145,7 @@ class Device(NamespaceMixin):
             "device_type": self.device_type,
             "room": str(self.room) if self.room else None,
             "measurement_count": len(self.measurements),
-            "properties": [str(property) for property in self.properties]
+            "properties": list(self._properties_str)
         }
         
     def __repr__(self):
@@ -80,8 +156,24 @@ class Device(NamespaceMixin):
                 f"room={self.room}, "
                 f"measurements={len(self.measurements)})")
     
+    def __getstate__(self):
+        """Pickle the field values, without the derived slots."""
+        return None, {f.name: getattr(self, f.name) for f in fields(self)
+                      if f.name not in _UNPICKLED_SLOTS}
+    
+    def __setstate__(self, state):
+        """Restore the field values (also from older pickles) and rebuild the derived slots."""
+        dict_state, slot_state = state
+        if dict_state:
+            self.__dict__.update(dict_state)
+        for name, value in slot_state.items():
+            setattr(self, name, value)
+        self._ts_array = None
+        self._ts_sorted_idx = None
+        self.__post_init__()
+    
     def __hash__(self):
-        return hash(self.uri)
+        return self._hash
     
     def __eq__(self, other):
         """Check equality based on URI."""
@@ -0,0 +1,50 @@
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from rdflib import URIRef
+
+# Process-wide dictionary encoding of URIs to small integer ids (OIDs).
+# Id -1 is reserved for missing values.
+_URI2ID: Dict[URIRef, int] = {}
+_ID2URI: List[URIRef] = []
+
+MISSING_ID = -1
+
+
+def intern_uri(uri: Optional[URIRef]) -> int:
+    """Return the integer id of a URI, assigning a new one on first sight."""
+    if uri is None:
+        return MISSING_ID
+    uri_id = _URI2ID.get(uri)
+    if uri_id is None:
+        uri_id = len(_ID2URI)
+        _URI2ID[uri] = uri_id
+        _ID2URI.append(uri)
+    return uri_id
+
+
+def decode_uri(uri_id: int) -> Optional[URIRef]:
+    """Return the URI for an id produced by `intern_uri`."""
+    if uri_id == MISSING_ID:
+        return None
+    return _ID2URI[uri_id]
+
+
+def decode_column(df: pd.DataFrame, col: str) -> pd.Series:
+    """
+    Decode an integer id column back to URI strings.
+
+    Args:
+        df: DataFrame holding the encoded column
+        col: Name of the id column (e.g. "device_id")
+
+    Returns:
+        Series of str (None for missing ids) aligned with df.index
+    """
+    # Only stringify each distinct id once
+    unique_ids, inverse = np.unique(df[col].to_numpy(), return_inverse=True)
+    table = np.empty(len(unique_ids), dtype=object)
+    for i, uri_id in enumerate(unique_ids):
+        uri = decode_uri(int(uri_id))
+        table[i] = str(uri) if uri is not None else None
+    return pd.Series(table[inverse], index=df.index, name=col)
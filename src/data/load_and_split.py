@@ -1,9 +1,12 @@
 import os
 import sys
+import hashlib
 import logging
 import torch
 from torch.utils.data import DataLoader, TensorDataset
 
+from ..utils.io_utils import atomic_torch_save
+
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,
@@ -36,22 +39,16 @@ def load_and_split_data(args):
     device = torch.device('cuda') if args.enable_cuda and torch.cuda.is_available() else torch.device('cpu')
     logger.info(f"Using device: {device}")
     
-    # Move tensors to the appropriate device
-    torch_input["adjacency_matrix"] = torch_input["adjacency_matrix"].to(device)
-    
-    # Move dynamic adjacencies to device
-    if "dynamic_adjacencies" in torch_input:
-        for step in torch_input["dynamic_adjacencies"]:
-            torch_input["dynamic_adjacencies"][step] = torch_input["dynamic_adjacencies"][step].to(device)
+    if args.tf32 and device.type == 'cuda':
+        # Process-wide: lets FP32 matmuls/convolutions run on TF32 tensor cores
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
     
-    # Move appropriate tensor based on task
-    if args.task_type == 'classification':
-        torch_input["workhour_labels"] = torch_input["workhour_labels"].to(device)
-    elif args.task_type == 'forecasting':
-        torch_input["consumption_values"] = torch_input["consumption_values"].to(device)
+    # Adjacency matrices stay on CPU: they are only used to build the GSOs in
+    # setup_model, which places the finished GSO on the device.
     
-    for time_idx in torch_input["feature_matrices"]:
-        torch_input["feature_matrices"][time_idx] = torch_input["feature_matrices"][time_idx].to(device)
+    # Feature matrices and targets stay on CPU: the DataLoaders pin them and the
+    # training loops copy each batch to the device with non_blocking=True.
     
     # Get all time indices
     time_indices = sorted(torch_input["time_indices"])
@@ -64,10 +61,29 @@ def load_and_split_data(args):
     
     logger.info(f"Using pre-computed data split: Train={len(train_indices)}, Val={len(val_indices)}, Test={len(test_indices)}")
     
-    # Extract features and targets for each set
-    X_train, y_train = extract_features_targets(torch_input, train_indices, n_his=args.n_his, task_type=args.task_type)
-    X_val, y_val = extract_features_targets(torch_input, val_indices, n_his=args.n_his, task_type=args.task_type)
-    X_test, y_test = extract_features_targets(torch_input, test_indices, n_his=args.n_his, task_type=args.task_type)
+    # Extract features and targets for each set (or reuse a cached extraction)
+    splits_path = _splits_cache_path(args, torch_input_path) if args.cache_splits else None
+    if splits_path is not None and os.path.exists(splits_path):
+        logger.info(f"Loading cached splits from {splits_path}")
+        # mmap: tensors are paged in from disk lazily instead of being read up front
+        splits = torch.load(splits_path, map_location='cpu', mmap=True)
+        X_train, y_train = splits["X_train"], splits["y_train"]
+        X_val, y_val = splits["X_val"], splits["y_val"]
+        X_test, y_test = splits["X_test"], splits["y_test"]
+    else:
+        # Replace the dict of per-time-step tensors with one contiguous stack
+        torch_input["feature_stack"], torch_input["feature_rows"] = stack_feature_matrices(
+            torch_input.pop("feature_matrices"))
+        X_train, y_train = extract_features_targets(torch_input, train_indices, n_his=args.n_his, task_type=args.task_type)
+        X_val, y_val = extract_features_targets(torch_input, val_indices, n_his=args.n_his, task_type=args.task_type)
+        X_test, y_test = extract_features_targets(torch_input, test_indices, n_his=args.n_his, task_type=args.task_type)
+        if splits_path is not None:
+            atomic_torch_save({
+                "X_train": X_train, "y_train": y_train,
+                "X_val": X_val, "y_val": y_val,
+                "X_test": X_test, "y_test": y_test,
+            }, splits_path)
+            logger.info(f"Cached splits to {splits_path}")
     
     # Create data loaders
     train_dataset = TensorDataset(X_train, y_train)
@@ -75,9 +91,21 @@ def load_and_split_data(args):
     test_dataset = TensorDataset(X_test, y_test)
     
     # Create data loaders (no shuffling for sequence data)
-    train_loader = DataLoader(train_dataset, batch_size=args.batch_size, shuffle=False)
-    val_loader = DataLoader(val_dataset, batch_size=args.batch_size, shuffle=False)
-    test_loader = DataLoader(test_dataset, batch_size=args.batch_size, shuffle=False)
+    loader_kwargs = {
+        'batch_size': args.batch_size,
+        'shuffle': False,
+        'pin_memory': device.type == 'cuda',
+        'num_workers': args.num_workers,
+    }
+    if args.num_workers > 0:
+        loader_kwargs['persistent_workers'] = True
+        loader_kwargs['prefetch_factor'] = 4
+    # The model is only compiled on CUDA; there a trailing partial batch would cost an
+    # extra compiled graph / CUDA-graph capture for its odd shape
+    train_loader = DataLoader(train_dataset, drop_last=args.compile and device.type == 'cuda',
+                              **loader_kwargs)
+    val_loader = DataLoader(val_dataset, **loader_kwargs)
+    test_loader = DataLoader(test_dataset, **loader_kwargs)
     
     # Get dimensions
     n_vertex = torch_input["adjacency_matrix"].shape[0]  # Number of rooms
@@ -100,6 +128,40 @@ def load_and_split_data(args):
         'device': device
     }
 
+def _splits_cache_path(args, torch_input_path):
+    """
+    Path of the cached extract_features_targets output for this torch input file.
+    
+    The key covers the source file (path, size, mtime), so regenerating the torch
+    input invalidates the cache, plus the arguments that shape the windows.
+    """
+    stat = os.stat(torch_input_path)
+    key = "|".join(str(part) for part in (
+        os.path.abspath(torch_input_path), stat.st_size, stat.st_mtime_ns,
+        args.n_his, args.task_type,
+    ))
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(os.path.dirname(torch_input_path), f"splits_{digest}.pt")
+
+def stack_feature_matrices(feature_matrices):
+    """
+    Consolidate the per-time-step feature matrices into one contiguous tensor.
+    
+    Args:
+        feature_matrices (Dict[int, Tensor]): time index -> [n_rooms, n_features]
+        
+    Returns:
+        Tuple[Tensor, Tensor]: (feature_stack, feature_rows)
+            feature_stack shape: [n_times, n_rooms, n_features], ordered by time index
+            feature_rows shape: [max_time_index + 1]; row of each time index in
+                feature_stack, or -1 if it has no feature matrix
+    """
+    times = sorted(feature_matrices)
+    feature_stack = torch.stack([feature_matrices[t] for t in times], dim=0).contiguous()
+    feature_rows = torch.full((times[-1] + 1,), -1, dtype=torch.long)
+    feature_rows[torch.as_tensor(times, dtype=torch.long)] = torch.arange(len(times))
+    return feature_stack, feature_rows
+
 def extract_features_targets(torch_input, indices, n_his=12, task_type='classification'):
     """
     Extract sequences of features and corresponding targets for STGCN input.
@@ -116,8 +178,12 @@ def extract_features_targets(torch_input, indices, n_his=12, task_type='classifi
             X shape: [num_samples, n_features, n_his, n_rooms] - preserving all features
             y shape: [num_samples] for classification, [num_samples, 1] for forecasting
     """
-    device = torch_input["feature_matrices"][indices[0]].device
-    feature_matrices = torch_input["feature_matrices"]
+    if "feature_stack" not in torch_input:
+        torch_input["feature_stack"], torch_input["feature_rows"] = stack_feature_matrices(torch_input["feature_matrices"])
+    feature_stack = torch_input["feature_stack"]
+    feature_rows = torch_input["feature_rows"]
+    device = feature_stack.device
+    n_rooms, n_features = feature_stack.shape[1:]
     
     # Get the appropriate target based on task type
     if task_type == 'classification':
@@ -125,53 +191,48 @@ def extract_features_targets(torch_input, indices, n_his=12, task_type='classifi
     else:  # forecasting
         targets = torch_input["consumption_values"]
 
-    X_list = []
-    y_list = []
-
     # Sort the indices to preserve time order
     indices = sorted(indices)
 
-    for i in range(n_his - 1, len(indices)):
-        time_window = indices[i - n_his + 1 : i + 1]
+    if len(indices) >= n_his:
+        # Which time steps have a feature matrix; windows containing a missing step are skipped
+        index_tensor = torch.as_tensor(indices, dtype=torch.long)
+        rows = torch.full_like(index_tensor, -1)
+        in_range = (index_tensor >= 0) & (index_tensor < feature_rows.numel())
+        rows[in_range] = feature_rows[index_tensor[in_range]]
+        present = rows >= 0
 
-        # Make sure all time steps are present in the feature matrices
-        if not all(t in feature_matrices for t in time_window):
-            continue
+        # Gather the split once: [len(indices), n_rooms, n_features]
+        # (missing steps read row 0, but every window containing them is dropped below)
+        F = feature_stack[rows.clamp(min=0)]
 
-        # Stack the sequence: shape will be [n_his, n_rooms, n_features]
-        x_seq = torch.stack([feature_matrices[t] for t in time_window], dim=0)
-        
-        # Transpose to get [n_features, n_his, n_rooms]
-        x_seq = x_seq.permute(2, 0, 1)
-        
-        # Add batch dimension
-        x_seq = x_seq.unsqueeze(0)  # [1, n_features, n_his, n_rooms]
-
-        # Add to list
-        X_list.append(x_seq)
-        y_list.append(targets[indices[i]])
+        # All windows as a strided view: [N, n_rooms, n_features, n_his] -> [N, n_features, n_his, n_rooms]
+        windows = F.unfold(0, n_his, 1).permute(0, 2, 3, 1)
+        valid_windows = present.unfold(0, n_his, 1).all(dim=1).nonzero().squeeze(1)
+        end_indices = index_tensor[n_his - 1:][valid_windows]
+    else:
+        end_indices = torch.empty(0, dtype=torch.long)
 
-    if not X_list:
+    if end_indices.numel() == 0:
         logger.warning(f"No valid sequences found for indices of length {len(indices)}")
         # Return empty tensors with correct shapes if no valid sequences
-        n_rooms = feature_matrices[indices[0]].shape[0]
-        n_features = feature_matrices[indices[0]].shape[1]
         return (
             torch.empty((0, n_features, n_his, n_rooms), device=device),
             torch.empty((0), device=device) if task_type == 'classification' else torch.empty((0, 1), device=device)
         )
 
     # Final shape: [batch, n_features, n_his, n_rooms]
-    X = torch.cat(X_list, dim=0).to(device)
+    # Gathered straight into one preallocated buffer (no intermediate copy of the windows)
+    X = torch.empty((len(valid_windows), n_features, n_his, n_rooms), dtype=F.dtype, device=device)
+    torch.index_select(windows, 0, valid_windows.to(device), out=X)
     
-    # For classification, stack normally
+    # For classification, gather normally
     # For forecasting, reshape to [batch, 1] to match regression output
-    if task_type == 'classification':
-        y = torch.stack(y_list).to(device)
-    else:  # forecasting
-        y = torch.stack(y_list).to(device).view(-1, 1)
+    y = targets[end_indices.to(targets.device)]
+    if task_type != 'classification':
+        y = y.view(-1, 1)
 
-    logger.info(f"Final feature tensor shape: {X.shape}")  # [batch, n_features, n_his, rooms]
-    logger.info(f"Final target shape: {y.shape}")
+    logger.debug(f"Final feature tensor shape: {X.shape}")  # [batch, n_features, n_his, rooms]
+    logger.debug(f"Final target shape: {y.shape}")
 
     return X, y
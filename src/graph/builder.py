@@ -139,7 +139,7 @@ class OfficeGraphBuilder:
             np.random.seed(seed)
 
         # Get all time indices
-        time_indices = list(range(len(self.time_buckets)))
+        time_indices = np.arange(len(self.time_buckets), dtype=np.int64)
         
         # Compute how many buckets per day, then per week (or 6-day)
         # (so 96/day for 15min, 48/day for 30T, 24/day for 1H, etc.)
@@ -150,11 +150,8 @@ class OfficeGraphBuilder:
         logger.info(f"Using {days_per_block}-day blocks, {block_size} buckets at {self.interval} each.")
 
         # Create blocks of contiguous time points
-        blocks = []
-        for i in range(0, len(time_indices), block_size):
-            # Take up to block_size indices (last block might be smaller)
-            block = time_indices[i:i+block_size]
-            blocks.append(block)
+        # (each up to block_size indices; the last block might be smaller)
+        blocks = np.array_split(time_indices, np.arange(block_size, time_indices.size, block_size))
         
         n_blocks = len(blocks)
         logger.info(f"Created {n_blocks} blocks of data (each 1 week)")
@@ -171,26 +168,24 @@ class OfficeGraphBuilder:
                         f"So, {n_extra_blocks} randomly chosen blocks will be assigned to train.")
             
             # Randomly select n_extra_blocks indices
-            extra_block_indices = np.random.choice(range(n_blocks), n_extra_blocks, replace=False)
-            
-            # Initialize train_indices list for extra blocks
-            train_indices = []
+            # (same draws as choice(range(n_blocks), ...), without materializing the range)
+            extra_block_indices = np.random.choice(n_blocks, n_extra_blocks, replace=False)
+            is_extra = np.zeros(n_blocks, dtype=bool)
+            is_extra[extra_block_indices] = True
             
-            # Add the selected blocks to training and remove them from blocks
-            # We need to process in reverse order to avoid index shifting during removal
-            for idx in sorted(extra_block_indices, reverse=True):
-                train_indices.extend(blocks[idx])
-                blocks.pop(idx)
+            # Add the selected blocks to training and remove them from blocks in one pass
+            train_blocks_list = [block for block, extra in zip(blocks, is_extra) if extra]
+            blocks = [block for block, extra in zip(blocks, is_extra) if not extra]
             
             # Update n_blocks after removal
             n_blocks = len(blocks)
         else:
-            # Initialize empty train_indices if no extra blocks
-            train_indices = []
+            # No extra blocks for training
+            train_blocks_list = []
         
-        # Initialize rest of the indices
-        val_indices = []
-        test_indices = []
+        # Initialize rest of the blocks
+        val_blocks_list = []
+        test_blocks_list = []
 
         # Calculate the repeat factor - how many times to repeat the pattern
         repeat_factor = n_blocks // total_requested_blocks
@@ -210,16 +205,21 @@ class OfficeGraphBuilder:
             
             # Assign the block to the corresponding split
             if split_type == "train":
-                train_indices.extend(block)
+                train_blocks_list.append(block)
             elif split_type == "val":
-                val_indices.extend(block)
+                val_blocks_list.append(block)
             else:  # "test"
-                test_indices.extend(block)
-        
-        # Sort indices within each split to maintain temporal order
-        train_indices.sort()
-        val_indices.sort()
-        test_indices.sort()
+                test_blocks_list.append(block)
+        
+        # Concatenate and sort indices within each split to maintain temporal order
+        # (stored as plain int lists, as before)
+        def _merge(split_blocks):
+            if not split_blocks:
+                return []
+            return np.sort(np.concatenate(split_blocks)).tolist()
+        train_indices = _merge(train_blocks_list)
+        val_indices = _merge(val_blocks_list)
+        test_indices = _merge(test_blocks_list)
         
         # Store the indices in the class
         self.train_indices = train_indices
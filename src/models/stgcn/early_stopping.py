@@ -42,5 +42,12 @@ class EarlyStopping:
     def save_checkpoint(self, val_loss, model):
         if self.verbose:
             logger.info(f'Validation loss decreased ({self.val_loss_min:.6f} --> {val_loss:.6f}). Saving model...')
-        self.best_model_state = model.state_dict().copy()
+        # state_dict() holds references to the live tensors, so snapshot them:
+        # clone once, then copy into the same buffers on later improvements
+        state = model.state_dict()
+        if self.best_model_state is None:
+            self.best_model_state = {k: v.detach().clone() for k, v in state.items()}
+        else:
+            for k, v in state.items():
+                self.best_model_state[k].copy_(v.detach(), non_blocking=True)
         self.val_loss_min = val_loss
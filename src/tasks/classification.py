@@ -8,11 +8,9 @@ import sys
 import logging
 import numpy as np
 import torch
-from torch_geometric.utils import dense_to_sparse
-import matplotlib.pyplot as plt
+from torch.utils.data import TensorDataset
 from sklearn.metrics import confusion_matrix, accuracy_score, precision_score, recall_score, f1_score
 from sklearn.metrics import roc_auc_score, average_precision_score, balanced_accuracy_score, precision_recall_curve
-import scipy.sparse as sp
 
 # Set up logging
 logging.basicConfig(
@@ -24,9 +22,13 @@ logger = logging.getLogger(__name__)
 
 from ..config.args import parse_args
 from ..data.load_and_split import load_and_split_data
-from ..utils.graph_utils import calc_gso_edge
+from ..utils.graph_utils import calc_gso_dense
+from ..utils.metrics_numba import NUMBA_AVAILABLE, best_f1_threshold
 from ..models.stgcn import EarlyStopping
 
+# Validation sets larger than this use the numba F1 sweep instead of sklearn
+NUMBA_SWEEP_MIN_SAMPLES = 100_000
+
 def setup_model(args, data, train_loader=None):
     """Set up the STGCN model and training components with class imbalance handling."""
     logger.info("Setting up model for forecasting...")
@@ -39,14 +41,17 @@ def setup_model(args, data, train_loader=None):
             f"in {{'rw_norm_adj','rw_renorm_adj'}}, got '{args.gso_type}'."
         )
 
+    # Optionally persist GSOs across runs (they only depend on adjacency + gso_type)
+    gso_cache_dir = os.path.join(args.data_dir, "processed", "gso_cache") if args.cache_gso else None
+
     # Build a single static GSO
     static_A = data["adjacency_matrix"]
-    edge_index, edge_weight = dense_to_sparse(static_A)
-    static_gso = calc_gso_edge(
-        edge_index, edge_weight, 
+    static_gso = calc_gso_dense(
+        static_A,
         num_nodes           = n_vertex,
         gso_type            = args.gso_type,
         device              = device,
+        cache_dir           = gso_cache_dir,
     )
     if args.gso_mode == "static":
         gso = static_gso
@@ -58,12 +63,13 @@ def setup_model(args, data, train_loader=None):
         dynamic_adjacencies = dynamic_adjacencies[: args.stblock_num]
         dynamic_gsos = []
         for adjacency_matrix in dynamic_adjacencies:
-            edge_index, edge_weight = dense_to_sparse(adjacency_matrix)
-            G = calc_gso_edge(
-                edge_index, edge_weight, 
+            # Cached: identical snapshots reuse the same GSO
+            G = calc_gso_dense(
+                adjacency_matrix,
                 num_nodes           = n_vertex,
                 gso_type            = args.gso_type,
                 device              = device,
+                cache_dir           = gso_cache_dir,
             )
             dynamic_gsos.append(G)
 
@@ -111,23 +117,39 @@ def setup_model(args, data, train_loader=None):
         task_type= 'forecasting',
     ).to(device)
     
+    if args.channels_last:
+        # NHWC layout for the temporal Conv2d layers (no-op for non-4D parameters)
+        model = model.to(memory_format=torch.channels_last)
+    
+    if args.compile and hasattr(torch, 'compile') and device.type == 'cuda':
+        # Static shapes: the train loader drops its last partial batch (see load_and_split_data)
+        model = torch.compile(model, mode="reduce-overhead", fullgraph=False, dynamic=False)
+    
     # Calculate class weights if train_loader is provided
     if train_loader is not None:
-        # Extract all labels from training set
-        all_labels = []
-        for _, labels in train_loader:
-            all_labels.extend(labels.cpu().numpy())
-        
-        # Count class occurrences
-        n_samples = len(all_labels)
-        n_work_hours = sum(all_labels)  # Class 1 (work hours)
-        n_non_work_hours = n_samples - n_work_hours  # Class 0 (non-work hours)
-        
-        # Calculate positive class weight (for work hours - minority class)
-        # Higher weight means the model pays more attention to this class
-        pos_weight = n_non_work_hours / n_work_hours if n_work_hours > 0 else 1.0
-        
-        logger.info(f"Class distribution in training set: Work hours={n_work_hours}, Non-work hours={n_non_work_hours}")
+        if 'pos_weight' in data:
+            # Computed by an earlier setup on the same data
+            pos_weight = data['pos_weight']
+        else:
+            # Extract all labels from training set
+            all_labels = _get_dataset_labels(train_loader.dataset)
+            if all_labels is None:
+                label_chunks = []
+                for _, labels in train_loader:
+                    label_chunks.append(labels)
+                all_labels = torch.cat(label_chunks)
+            
+            # Count class occurrences
+            n_samples = all_labels.numel()
+            n_work_hours = int(all_labels.sum().item())  # Class 1 (work hours)
+            n_non_work_hours = n_samples - n_work_hours  # Class 0 (non-work hours)
+            
+            # Calculate positive class weight (for work hours - minority class)
+            # Higher weight means the model pays more attention to this class
+            pos_weight = n_non_work_hours / n_work_hours if n_work_hours > 0 else 1.0
+            data['pos_weight'] = pos_weight
+            
+            logger.info(f"Class distribution in training set: Work hours={n_work_hours}, Non-work hours={n_non_work_hours}")
         logger.info(f"Using positive class weight: {pos_weight:.4f}")
         
         # Binary classification loss function with class weight
@@ -136,11 +158,12 @@ def setup_model(args, data, train_loader=None):
         # Default loss without weighting
         criterion = torch.nn.BCEWithLogitsLoss()
     
-    # Set optimizer
+    # Set optimizer (fused Adam/AdamW kernels are CUDA-only)
+    fused = device.type == 'cuda'
     if args.optimizer == 'adam':
-        optimizer = torch.optim.Adam(model.parameters(), lr=args.lr, weight_decay=args.weight_decay_rate)
+        optimizer = torch.optim.Adam(model.parameters(), lr=args.lr, weight_decay=args.weight_decay_rate, fused=fused)
     elif args.optimizer == 'adamw':
-        optimizer = torch.optim.AdamW(model.parameters(), lr=args.lr, weight_decay=args.weight_decay_rate)
+        optimizer = torch.optim.AdamW(model.parameters(), lr=args.lr, weight_decay=args.weight_decay_rate, fused=fused)
     else:
         optimizer = torch.optim.SGD(model.parameters(), lr=args.lr, momentum=0.9, weight_decay=args.weight_decay_rate)
     
@@ -155,6 +178,17 @@ def setup_model(args, data, train_loader=None):
     return model, criterion, optimizer, scheduler, early_stopping
 
 
+def _get_dataset_labels(dataset):
+    """Return the label tensor of a dataset without iterating it, or None if not exposed."""
+    if isinstance(dataset, TensorDataset):
+        return dataset.tensors[1]
+    if hasattr(dataset, 'targets'):
+        return torch.as_tensor(dataset.targets)
+    if hasattr(dataset, 'y'):
+        return torch.as_tensor(dataset.y)
+    return None
+
+
 def train_model(args, model, criterion, optimizer, scheduler, early_stopping, train_loader, val_loader):
     """Train the STGCN model."""
     logger.info("Starting model training...")
@@ -162,6 +196,11 @@ def train_model(args, model, criterion, optimizer, scheduler, early_stopping, tr
     # Get device
     device = next(model.parameters()).device
     
+    # Mixed precision (bfloat16 autocast) is only used on CUDA; bfloat16 has the
+    # FP32 exponent range, so no GradScaler is needed
+    use_amp = args.amp and device.type == 'cuda'
+    memory_format = torch.channels_last if args.channels_last else torch.preserve_format
+    
     train_losses = []
     val_losses = []
     val_accuracies = []
@@ -169,50 +208,65 @@ def train_model(args, model, criterion, optimizer, scheduler, early_stopping, tr
     for epoch in range(args.epochs):
         # Training phase
         model.train()
-        train_loss = 0.0
+        train_loss = torch.zeros((), device=device)  # accumulated on device, synced once
+        n_train_samples = 0
         
         for X_batch, y_batch in train_loader:
-            # Zero the gradients
-            optimizer.zero_grad()
+            X_batch = X_batch.to(device, non_blocking=True, memory_format=memory_format)
+            y_batch = y_batch.to(device, non_blocking=True)
             
-            # Forward pass
-            outputs = model(X_batch).squeeze()
+            # Zero the gradients
+            optimizer.zero_grad(set_to_none=True)
             
-            # Compute loss
-            loss = criterion(outputs, y_batch.float())
+            # Forward pass and loss (bfloat16 autocast when enabled)
+            with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_amp):
+                outputs = model(X_batch).squeeze()
+                loss = criterion(outputs, y_batch.float())
             
             # Backward pass and optimize
             loss.backward()
             optimizer.step()
             
-            train_loss += loss.item() * X_batch.size(0)
+            train_loss += loss.detach() * X_batch.size(0)
+            n_train_samples += X_batch.size(0)
         
         # Average training loss for the epoch
-        train_loss = train_loss / len(train_loader.dataset)
+        # (may be fewer than len(train_loader.dataset) when drop_last is set)
+        train_loss = train_loss.item() / max(n_train_samples, 1)
         train_losses.append(train_loss)
         
         # Validation phase
         model.eval()
-        val_loss = 0.0
-        all_preds = []
-        all_labels = []
+        val_loss = torch.zeros((), device=device)  # accumulated on device, synced once
+        pred_chunks = []
+        label_chunks = []
         
-        with torch.no_grad():
+        with torch.inference_mode():
             for X_batch, y_batch in val_loader:
-                # Forward pass
-                outputs = model(X_batch).squeeze()
+                X_batch = X_batch.to(device, non_blocking=True, memory_format=memory_format)
+                y_batch = y_batch.to(device, non_blocking=True)
+                
+                # Forward pass (bfloat16 autocast when enabled; metrics and loss in FP32)
+                with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_amp):
+                    outputs = model(X_batch).squeeze()
+                outputs = outputs.float()
                 
                 # Compute loss
                 loss = criterion(outputs, y_batch.float())
-                val_loss += loss.item() * X_batch.size(0)
+                val_loss += loss.detach() * X_batch.size(0)
                 
                 # Store predictions and labels for accuracy calculation
-                preds = (torch.sigmoid(outputs) > 0.5).int()
-                all_preds.extend(preds.cpu().numpy())
-                all_labels.extend(y_batch.cpu().numpy())
+                # (kept on device, transferred once after the loop)
+                # sigmoid(x) > 0.5 <=> x > 0, so no sigmoid is needed here
+                preds = (outputs > 0).to(torch.uint8)
+                pred_chunks.append(preds.view(-1))
+                label_chunks.append(y_batch.view(-1))
+        
+        all_preds = torch.cat(pred_chunks).cpu().numpy()
+        all_labels = torch.cat(label_chunks).cpu().numpy()
         
         # Average validation loss for the epoch
-        val_loss = val_loss / len(val_loader.dataset)
+        val_loss = val_loss.item() / len(val_loader.dataset)
         val_losses.append(val_loss)
         
         # Calculate validation accuracy
@@ -248,73 +302,95 @@ def train_model(args, model, criterion, optimizer, scheduler, early_stopping, tr
     return model, history
 
 
-def find_optimal_threshold(model, val_loader):
+def find_optimal_threshold(model, val_loader, amp=False, channels_last=False):
     """Find the optimal classification threshold using validation data."""
     logger.info("Finding optimal threshold on validation set...")
     
+    device = next(model.parameters()).device
+    use_amp = amp and device.type == 'cuda'
+    memory_format = torch.channels_last if channels_last else torch.preserve_format
     model.eval()
-    all_probs = []
-    all_labels = []
+    prob_chunks = []
+    label_chunks = []
     
-    with torch.no_grad():
+    with torch.inference_mode():
         for X_batch, y_batch in val_loader:
-            # Forward pass
-            outputs = model(X_batch).squeeze()
+            X_batch = X_batch.to(device, non_blocking=True, memory_format=memory_format)
+            y_batch = y_batch.to(device, non_blocking=True)
+            
+            # Forward pass (bfloat16 autocast when enabled; metrics and loss in FP32)
+            with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_amp):
+                outputs = model(X_batch).squeeze()
+            outputs = outputs.float()
             
             # Store probabilities and labels
             probs = torch.sigmoid(outputs)
-            all_probs.extend(probs.cpu().numpy())
-            all_labels.extend(y_batch.cpu().numpy())
+            prob_chunks.append(probs.view(-1))
+            label_chunks.append(y_batch.view(-1))
     
-    # Find optimal threshold on validation set
-    precisions, recalls, thresholds = precision_recall_curve(all_labels, all_probs)
+    all_probs = torch.cat(prob_chunks).cpu().numpy()
+    all_labels = torch.cat(label_chunks).cpu().numpy()
     
-    # Compute F1 scores for each threshold
-    f1_scores = []
-    for p, r in zip(precisions, recalls):
-        if p + r == 0:
-            f1_scores.append(0)
-        else:
-            f1_scores.append(2 * p * r / (p + r))
-    
-    # Find threshold that maximizes F1 score
-    if len(thresholds) > 0:
-        optimal_idx = np.argmax(f1_scores[:-1])  # Last element doesn't have a threshold
-        optimal_threshold = thresholds[optimal_idx]
+    # Find optimal threshold on validation set
+    if NUMBA_AVAILABLE and len(all_probs) > NUMBA_SWEEP_MIN_SAMPLES:
+        # Single-pass jitted sweep for large validation sets
+        optimal_threshold = best_f1_threshold(all_probs, all_labels)
     else:
-        optimal_threshold = 0.5  # Default if no threshold found
+        precisions, recalls, thresholds = precision_recall_curve(all_labels, all_probs)
+    
+        # Compute F1 scores for each threshold (0 where precision + recall == 0)
+        denom = precisions + recalls
+        f1_scores = np.zeros_like(precisions)
+        nonzero = denom > 0
+        f1_scores[nonzero] = 2 * precisions[nonzero] * recalls[nonzero] / denom[nonzero]
+    
+        # Find threshold that maximizes F1 score
+        if len(thresholds) > 0:
+            optimal_idx = int(np.argmax(f1_scores[:-1]))  # Last element doesn't have a threshold
+            optimal_threshold = float(thresholds[optimal_idx])
+        else:
+            optimal_threshold = 0.5  # Default if no threshold found
     
     logger.info(f"Optimal classification threshold: {optimal_threshold:.4f}")
     return optimal_threshold
 
 
-def evaluate_model(model, criterion, test_loader, threshold=0.5):
+def evaluate_model(model, criterion, test_loader, threshold=0.5, amp=False, channels_last=False):
     """Evaluate the trained model on the test set with a pre-determined threshold."""
     logger.info(f"Evaluating model on test set using threshold: {threshold:.4f}...")
     
     device = next(model.parameters()).device
+    use_amp = amp and device.type == 'cuda'
+    memory_format = torch.channels_last if channels_last else torch.preserve_format
     model.eval()
-    test_loss = 0.0
-    all_preds = []
-    all_labels = []
-    all_probs = []
+    test_loss = torch.zeros((), device=device)  # accumulated on device, synced once
+    prob_chunks = []
+    label_chunks = []
     
-    with torch.no_grad():
+    with torch.inference_mode():
         for X_batch, y_batch in test_loader:
-            # Forward pass
-            outputs = model(X_batch).squeeze()
+            X_batch = X_batch.to(device, non_blocking=True, memory_format=memory_format)
+            y_batch = y_batch.to(device, non_blocking=True)
+            
+            # Forward pass (bfloat16 autocast when enabled; metrics and loss in FP32)
+            with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_amp):
+                outputs = model(X_batch).squeeze()
+            outputs = outputs.float()
             
             # Compute loss
             loss = criterion(outputs, y_batch.float())
-            test_loss += loss.item() * X_batch.size(0)
+            test_loss += loss.detach() * X_batch.size(0)
             
             # Store predictions, probabilities, and labels
             probs = torch.sigmoid(outputs)
-            all_probs.extend(probs.cpu().numpy())
-            all_labels.extend(y_batch.cpu().numpy())
+            prob_chunks.append(probs.view(-1))
+            label_chunks.append(y_batch.view(-1))
+    
+    all_probs = torch.cat(prob_chunks).cpu().numpy()
+    all_labels = torch.cat(label_chunks).cpu().numpy()
     
     # Average test loss
-    test_loss = test_loss / len(test_loader.dataset)
+    test_loss = test_loss.item() / len(test_loader.dataset)
     
     # AUC scores
     try:
@@ -329,7 +405,7 @@ def evaluate_model(model, criterion, test_loader, threshold=0.5):
     logger.info(f"AUC-PR (Average Precision): {ap_score:.4f}")
 
     # Apply the pre-determined threshold to get predictions
-    all_preds = [1 if prob >= threshold else 0 for prob in all_probs]
+    all_preds = (all_probs >= threshold).astype(np.int8)
     
     # Calculate metrics
     accuracy = accuracy_score(all_labels, all_preds)
@@ -366,9 +442,9 @@ def evaluate_model(model, criterion, test_loader, threshold=0.5):
     logger.info(f"Confusion Matrix:\n{conf_matrix}")
     
     # Calculate baseline accuracy (always predicting the majority class)
-    pos_count = sum(all_labels)
-    neg_count = len(all_labels) - pos_count
-    baseline = max(pos_count, neg_count) / len(all_labels)
+    pos_count = int(all_labels.sum())
+    neg_count = all_labels.size - pos_count
+    baseline = max(pos_count, neg_count) / all_labels.size
     logger.info(f"Baseline Accuracy (majority class): {baseline:.4f}")
     logger.info(f"Improvement over baseline: {(accuracy - baseline) / baseline * 100:.2f}%")
     
@@ -383,6 +459,11 @@ def evaluate_model(model, criterion, test_loader, threshold=0.5):
 
 def plot_results(args, history, metrics):
     """Plot and save training curves and evaluation results."""
+    # Imported here so training-only runs don't pay for matplotlib; Agg avoids a GUI backend
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    
     logger.info("Plotting results...")
     
     # Create output directory
@@ -410,9 +491,10 @@ def plot_results(args, history, metrics):
                 label=f'Test Accuracy: {metrics["accuracy"]:.4f}')
     
     # Add baseline
-    pos_count = sum(metrics['labels'])
-    neg_count = len(metrics['labels']) - pos_count
-    baseline = max(pos_count, neg_count) / len(metrics['labels'])
+    labels_arr = np.asarray(metrics['labels'])
+    pos_count = int(labels_arr.sum())
+    neg_count = labels_arr.size - pos_count
+    baseline = max(pos_count, neg_count) / labels_arr.size
     plt.axhline(y=baseline, color='grey', linestyle=':', 
                 label=f'Baseline: {baseline:.4f}')
     
@@ -491,13 +573,16 @@ def main():
     )
     
     # Evaluate model
-    metrics = evaluate_model(model, criterion, data['test_loader'])
+    # Evaluate the uncompiled module: a single pass doesn't amortize compilation
+    metrics = evaluate_model(getattr(model, '_orig_mod', model), criterion, data['test_loader'],
+                             amp=args.amp, channels_last=args.channels_last)
     
     # Plot results
     plot_results(args, history, metrics)
     
     # Save model
-    torch.save(model.state_dict(), os.path.join(args.output_dir, 'stgcn_model.pt'))
+    # (unwrap torch.compile so the saved keys match the plain model)
+    torch.save(getattr(model, '_orig_mod', model).state_dict(), os.path.join(args.output_dir, 'stgcn_model.pt'))
     
     logger.info("Done!")
 
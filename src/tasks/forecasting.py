@@ -8,10 +8,7 @@ import sys
 import logging
 import numpy as np
 import torch
-from torch_geometric.utils import dense_to_sparse
-import matplotlib.pyplot as plt
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
-import scipy.sparse as sp
 
 # Set up logging
 logging.basicConfig(
@@ -23,7 +20,7 @@ logger = logging.getLogger(__name__)
 
 from ..config.args import parse_args
 from ..data.load_and_split import load_and_split_data
-from ..utils.graph_utils import calc_gso_edge
+from ..utils.graph_utils import calc_gso_dense
 from ..models.stgcn import EarlyStopping
 
 def setup_model(args, data):
@@ -38,14 +35,17 @@ def setup_model(args, data):
             f"in {{'rw_norm_adj','rw_renorm_adj'}}, got '{args.gso_type}'."
         )
 
+    # Optionally persist GSOs across runs (they only depend on adjacency + gso_type)
+    gso_cache_dir = os.path.join(args.data_dir, "processed", "gso_cache") if args.cache_gso else None
+
     # Build a single static GSO
     static_A = data["adjacency_matrix"]
-    edge_index, edge_weight = dense_to_sparse(static_A)
-    static_gso = calc_gso_edge(
-        edge_index, edge_weight, 
+    static_gso = calc_gso_dense(
+        static_A,
         num_nodes           = n_vertex,
         gso_type            = args.gso_type,
         device              = device,
+        cache_dir           = gso_cache_dir,
     )
     if args.gso_mode == "static":
         gso = static_gso
@@ -57,12 +57,13 @@ def setup_model(args, data):
         dynamic_adjacencies = dynamic_adjacencies[: args.stblock_num]
         dynamic_gsos = []
         for adjacency_matrix in dynamic_adjacencies:
-            edge_index, edge_weight = dense_to_sparse(adjacency_matrix)
-            G = calc_gso_edge(
-                edge_index, edge_weight, 
+            # Cached: identical snapshots reuse the same GSO
+            G = calc_gso_dense(
+                adjacency_matrix,
                 num_nodes           = n_vertex,
                 gso_type            = args.gso_type,
                 device              = device,
+                cache_dir           = gso_cache_dir,
             )
             dynamic_gsos.append(G)
 
@@ -109,15 +110,24 @@ def setup_model(args, data):
         gso      = gso,
         task_type= 'forecasting',
     ).to(device)
+    
+    if args.channels_last:
+        # NHWC layout for the temporal Conv2d layers (no-op for non-4D parameters)
+        model = model.to(memory_format=torch.channels_last)
+    
+    if args.compile and hasattr(torch, 'compile') and device.type == 'cuda':
+        # Static shapes: the train loader drops its last partial batch (see load_and_split_data)
+        model = torch.compile(model, mode="reduce-overhead", fullgraph=False, dynamic=False)
 
     # Set loss function for regression
     criterion = torch.nn.MSELoss()
     
-    # Set optimizer
+    # Set optimizer (fused Adam/AdamW kernels are CUDA-only)
+    fused = device.type == 'cuda'
     if args.optimizer == 'adam':
-        optimizer = torch.optim.Adam(model.parameters(), lr=args.lr, weight_decay=args.weight_decay_rate)
+        optimizer = torch.optim.Adam(model.parameters(), lr=args.lr, weight_decay=args.weight_decay_rate, fused=fused)
     elif args.optimizer == 'adamw':
-        optimizer = torch.optim.AdamW(model.parameters(), lr=args.lr, weight_decay=args.weight_decay_rate)
+        optimizer = torch.optim.AdamW(model.parameters(), lr=args.lr, weight_decay=args.weight_decay_rate, fused=fused)
     else:
         optimizer = torch.optim.SGD(model.parameters(), lr=args.lr, momentum=0.9, weight_decay=args.weight_decay_rate)
     
@@ -136,6 +146,14 @@ def train_model(args, model, criterion, optimizer, scheduler, early_stopping, tr
     """Train the STGCN model for forecasting."""
     logger.info("Starting model training...")
     
+    # Get device
+    device = next(model.parameters()).device
+    
+    # Mixed precision (bfloat16 autocast) is only used on CUDA; bfloat16 has the
+    # FP32 exponent range, so no GradScaler is needed
+    use_amp = args.amp and device.type == 'cuda'
+    memory_format = torch.channels_last if args.channels_last else torch.preserve_format
+    
     train_losses = []
     val_losses = []
     val_r2_scores = []
@@ -143,44 +161,56 @@ def train_model(args, model, criterion, optimizer, scheduler, early_stopping, tr
     for epoch in range(args.epochs):
         # Training phase
         model.train()
-        train_loss = 0.0
+        train_loss = torch.zeros((), device=device)  # accumulated on device, synced once
+        n_train_samples = 0
         
         for X_batch, y_batch in train_loader:
-            # Zero the gradients
-            optimizer.zero_grad()
+            X_batch = X_batch.to(device, non_blocking=True, memory_format=memory_format)
+            y_batch = y_batch.to(device, non_blocking=True)
             
-            # Forward pass
-            outputs = model(X_batch)
-            
-            # Ensure shapes match for loss calculation
-            if len(outputs.shape) == 1:
-                outputs = outputs.unsqueeze(1)  # [B] -> [B, 1]
-            if len(y_batch.shape) == 1:
-                y_batch = y_batch.unsqueeze(1)  # [B] -> [B, 1]
+            # Zero the gradients
+            optimizer.zero_grad(set_to_none=True)
             
-            # Compute loss
-            loss = criterion(outputs, y_batch.float())
+            # Forward pass and loss (bfloat16 autocast when enabled)
+            with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_amp):
+                outputs = model(X_batch)
+                
+                # Ensure shapes match for loss calculation
+                if len(outputs.shape) == 1:
+                    outputs = outputs.unsqueeze(1)  # [B] -> [B, 1]
+                if len(y_batch.shape) == 1:
+                    y_batch = y_batch.unsqueeze(1)  # [B] -> [B, 1]
+                
+                # Compute loss
+                loss = criterion(outputs, y_batch.float())
             
             # Backward pass and optimize
             loss.backward()
             optimizer.step()
             
-            train_loss += loss.item() * X_batch.size(0)
+            train_loss += loss.detach() * X_batch.size(0)
+            n_train_samples += X_batch.size(0)
         
         # Average training loss for the epoch
-        train_loss = train_loss / len(train_loader.dataset)
+        # (may be fewer than len(train_loader.dataset) when drop_last is set)
+        train_loss = train_loss.item() / max(n_train_samples, 1)
         train_losses.append(train_loss)
         
         # Validation phase
         model.eval()
-        val_loss = 0.0
-        all_preds = []
-        all_targets = []
+        val_loss = torch.zeros((), device=device)  # accumulated on device, synced once
+        pred_chunks = []
+        target_chunks = []
         
-        with torch.no_grad():
+        with torch.inference_mode():
             for X_batch, y_batch in val_loader:
-                # Forward pass
-                outputs = model(X_batch)
+                X_batch = X_batch.to(device, non_blocking=True, memory_format=memory_format)
+                y_batch = y_batch.to(device, non_blocking=True)
+                
+                # Forward pass (bfloat16 autocast when enabled; metrics and loss in FP32)
+                with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_amp):
+                    outputs = model(X_batch)
+                outputs = outputs.float()
                 
                 # Ensure shapes match for loss calculation
                 if len(outputs.shape) == 1:
@@ -190,14 +220,19 @@ def train_model(args, model, criterion, optimizer, scheduler, early_stopping, tr
                 
                 # Compute loss
                 loss = criterion(outputs, y_batch.float())
-                val_loss += loss.item() * X_batch.size(0)
+                val_loss += loss.detach() * X_batch.size(0)
                 
                 # Store predictions and targets for metrics calculation
-                all_preds.extend(outputs.cpu().numpy())
-                all_targets.extend(y_batch.cpu().numpy())
+                # (kept on device, transferred once after the loop; cloned because
+                # CUDA-graph outputs of a compiled model are reused between calls)
+                pred_chunks.append(outputs.clone())
+                target_chunks.append(y_batch)
+        
+        all_preds = torch.cat(pred_chunks).cpu().numpy()
+        all_targets = torch.cat(target_chunks).cpu().numpy()
         
         # Average validation loss for the epoch
-        val_loss = val_loss / len(val_loader.dataset)
+        val_loss = val_loss.item() / len(val_loader.dataset)
         val_losses.append(val_loss)
         
         # Calculate validation R² score
@@ -233,19 +268,27 @@ def train_model(args, model, criterion, optimizer, scheduler, early_stopping, tr
     return model, history
 
 
-def evaluate_model(model, criterion, test_loader):
+def evaluate_model(model, criterion, test_loader, amp=False, channels_last=False):
     """Evaluate the trained model on the test set."""
     logger.info("Evaluating model on test set...")
     
+    device = next(model.parameters()).device
+    use_amp = amp and device.type == 'cuda'
+    memory_format = torch.channels_last if channels_last else torch.preserve_format
     model.eval()
-    test_loss = 0.0
-    all_preds = []
-    all_targets = []
+    test_loss = torch.zeros((), device=device)  # accumulated on device, synced once
+    pred_chunks = []
+    target_chunks = []
     
-    with torch.no_grad():
+    with torch.inference_mode():
         for X_batch, y_batch in test_loader:
-            # Forward pass
-            outputs = model(X_batch)
+            X_batch = X_batch.to(device, non_blocking=True, memory_format=memory_format)
+            y_batch = y_batch.to(device, non_blocking=True)
+            
+            # Forward pass (bfloat16 autocast when enabled; metrics and loss in FP32)
+            with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_amp):
+                outputs = model(X_batch)
+            outputs = outputs.float()
             
             # Ensure shapes match for loss calculation
             if len(outputs.shape) == 1:
@@ -255,18 +298,18 @@ def evaluate_model(model, criterion, test_loader):
             
             # Compute loss
             loss = criterion(outputs, y_batch.float())
-            test_loss += loss.item() * X_batch.size(0)
+            test_loss += loss.detach() * X_batch.size(0)
             
             # Store predictions and targets for metrics calculation
-            all_preds.extend(outputs.cpu().numpy())
-            all_targets.extend(y_batch.cpu().numpy())
+            pred_chunks.append(outputs.clone())
+            target_chunks.append(y_batch)
     
     # Reshape for metric calculations
-    all_preds = np.array(all_preds).reshape(-1)
-    all_targets = np.array(all_targets).reshape(-1)
+    all_preds = torch.cat(pred_chunks).cpu().numpy().reshape(-1)
+    all_targets = torch.cat(target_chunks).cpu().numpy().reshape(-1)
     
     # Average test loss
-    test_loss = test_loss / len(test_loader.dataset)
+    test_loss = test_loss.item() / len(test_loader.dataset)
     
     # Calculate metrics
     rmse = np.sqrt(mean_squared_error(all_targets, all_preds))
@@ -299,6 +342,11 @@ def evaluate_model(model, criterion, test_loader):
 
 def plot_results(args, history, metrics):
     """Plot and save training curves and evaluation results."""
+    # Imported here so training-only runs don't pay for matplotlib; Agg avoids a GUI backend
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    
     logger.info("Plotting results...")
     
     # Create output directory
@@ -407,13 +455,16 @@ def main():
     )
     
     # Evaluate model
-    metrics = evaluate_model(model, criterion, data['test_loader'])
+    # Evaluate the uncompiled module: a single pass doesn't amortize compilation
+    metrics = evaluate_model(getattr(model, '_orig_mod', model), criterion, data['test_loader'],
+                             amp=args.amp, channels_last=args.channels_last)
     
     # Plot results
     plot_results(args, history, metrics)
     
     # Save model
-    torch.save(model.state_dict(), os.path.join(args.output_dir, 'stgcn_forecasting_model.pt'))
+    # (unwrap torch.compile so the saved keys match the plain model)
+    torch.save(getattr(model, '_orig_mod', model).state_dict(), os.path.join(args.output_dir, 'stgcn_forecasting_model.pt'))
     
     logger.info("Done!")
 
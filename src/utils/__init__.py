@@ -1 +1,3 @@
 from .graph_utils import *
+from .metrics_numba import *
+from .io_utils import *
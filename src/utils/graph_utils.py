@@ -1,7 +1,12 @@
+import os
+import hashlib
+from typing import Optional
 import torch
-from torch_geometric.utils import add_self_loops, degree, get_laplacian
+from torch_geometric.utils import add_self_loops, degree, get_laplacian, dense_to_sparse
 from torch_geometric.nn.conv.gcn_conv import gcn_norm
 
+from .io_utils import atomic_torch_save
+
 def calc_gso_edge(edge_index: torch.LongTensor,
                   edge_weight: torch.Tensor,
                   num_nodes: int,
@@ -67,3 +72,46 @@ def calc_gso_edge(edge_index: torch.LongTensor,
         (num_nodes, num_nodes),
         device=device
     ).to_dense()
+
+
+# GSOs built from dense adjacencies, keyed by adjacency content + build options
+_gso_cache = {}
+
+def calc_gso_dense(adjacency_matrix: torch.Tensor,
+                   num_nodes: int,
+                   gso_type: str,
+                   device: torch.device,
+                   cache_dir: Optional[str] = None):
+    """
+    Build a dense GSO from a dense adjacency matrix via `calc_gso_edge`.
+
+    Results are memoized on the adjacency content, so identical adjacencies
+    (e.g. repeated dynamic snapshots) only go through dense_to_sparse once.
+    The sparse conversion runs on CPU; only the finished GSO is placed on `device`.
+    If `cache_dir` is given, GSOs are also persisted there as gso_<hash>.pt and
+    reused across runs.
+    """
+    adj = adjacency_matrix.detach().cpu().contiguous()
+    digest = hashlib.sha1(adj.numpy().tobytes())
+    digest.update(f"{tuple(adj.shape)}|{adj.dtype}|{num_nodes}|{gso_type}".encode())
+    key = (digest.hexdigest(), str(device))
+    gso = _gso_cache.get(key)
+    if gso is not None:
+        return gso
+
+    cache_path = os.path.join(cache_dir, f"gso_{digest.hexdigest()[:16]}.pt") if cache_dir else None
+    if cache_path is not None and os.path.exists(cache_path):
+        gso = torch.load(cache_path, map_location='cpu').to(device)
+    else:
+        edge_index, edge_weight = dense_to_sparse(adj)
+        gso = calc_gso_edge(
+            edge_index, edge_weight,
+            num_nodes = num_nodes,
+            gso_type  = gso_type,
+            device    = device,
+        )
+        if cache_path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            atomic_torch_save(gso.cpu(), cache_path)
+    _gso_cache[key] = gso
+    return gso
@@ -0,0 +1,23 @@
+import os
+import tempfile
+import torch
+
+
+def atomic_torch_save(obj, path: str) -> None:
+    """
+    torch.save `obj` to `path` without ever leaving a partial file there.
+
+    The data is written to a temporary file in the same directory and then
+    moved into place with os.replace, so an interrupted run leaves either the
+    previous file or no file (never a truncated cache).
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".",
+                                    prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            torch.save(obj, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
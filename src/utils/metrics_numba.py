@@ -0,0 +1,77 @@
+import numpy as np
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+
+    @njit(cache=True)
+    def _cumulative_counts(probs_sorted, labels_sorted):
+        """Cumulative true/false positive counts for probabilities sorted descending."""
+        n = probs_sorted.shape[0]
+        tps = np.empty(n, dtype=np.int64)
+        fps = np.empty(n, dtype=np.int64)
+        tp = 0
+        fp = 0
+        for i in range(n):
+            if labels_sorted[i] != 0:
+                tp += 1
+            else:
+                fp += 1
+            tps[i] = tp
+            fps[i] = fp
+        return tps, fps
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def f1_sweep(probs_sorted, labels_sorted):
+        """
+        F1 score for every candidate threshold in one pass.
+
+        Args:
+            probs_sorted: float32 probabilities, sorted in descending order
+            labels_sorted: int8 labels (0/1) in the same order
+
+        Returns:
+            f1: float64 array; f1[i] is the F1 score when predicting positive for
+                prob >= probs_sorted[i]. Positions inside a run of tied
+                probabilities (not a valid cut) are 0.
+        """
+        n = probs_sorted.shape[0]
+        tps, fps = _cumulative_counts(probs_sorted, labels_sorted)
+        n_pos = tps[n - 1] if n > 0 else 0
+        f1 = np.zeros(n, dtype=np.float64)
+        for i in prange(n):
+            if i < n - 1 and probs_sorted[i] == probs_sorted[i + 1]:
+                continue
+            tp = tps[i]
+            # 2TP / (2TP + FP + FN) == 2PR / (P + R)
+            denom = tp + fps[i] + n_pos
+            if denom > 0:
+                f1[i] = 2.0 * tp / denom
+        return f1
+
+
+def best_f1_threshold(probs, labels):
+    """
+    Return the probability threshold that maximizes F1 (requires numba).
+
+    Ties are broken towards the lowest threshold. The best F1 equals the one
+    from sklearn's precision_recall_curve, but F1 is computed as
+    2TP / (2TP + FP + FN) rather than 2PR / (P + R), so when several thresholds
+    reach the same F1 the rounding can differ and a different threshold may
+    be returned.
+    """
+    if not NUMBA_AVAILABLE:
+        raise ImportError("best_f1_threshold requires numba")
+    probs = np.asarray(probs, dtype=np.float32)
+    order = np.argsort(-probs, kind="stable")
+    probs_sorted = np.ascontiguousarray(probs[order])
+    labels_sorted = np.ascontiguousarray(np.asarray(labels)[order].astype(np.int8))
+    f1 = f1_sweep(probs_sorted, labels_sorted)
+    # Reverse so argmax returns the lowest threshold among equal scores
+    best = len(f1) - 1 - int(np.argmax(f1[::-1]))
+    return float(probs_sorted[best])